@@ -1,7 +1,9 @@
 from __future__ import annotations
 from typing import Callable, Any
+from functools import lru_cache
 import torch
 from numpy import pi
+from ..util import bulk_to
 
 
 class SimData:
@@ -29,9 +31,11 @@ class SimData:
     B0 : torch.Tensor
         Per voxel B0 inhomogentity (Hertz)
     B1 : torch.Tensor
-        (coil_count, voxel_count) Per coil and per voxel B1 inhomogenity
+        (coil_count, voxel_count) Per coil and per voxel B1 inhomogenity,
+        stored contiguously with voxels as the fast dimension
     coil_sens : torch.Tensor
-        (coil_count, voxel_count) Per coil sensitivity (arbitrary units)
+        (coil_count, voxel_count) Per coil sensitivity (arbitrary units),
+        stored contiguously with voxels as the fast dimension
     fov : torch.Tensor
         Physical size of the phantom, needed for diffusion (meters).
         More specifically, a gradient moment of 1 has a wavelength of fov
@@ -91,8 +95,10 @@ class SimData:
         self.T2dash = T2dash.clamp(min=1e-6)
         self.D = D.clamp(min=1e-6)
         self.B0 = B0.clone()
-        self.B1 = B1.clone()
-        self.coil_sens = coil_sens.clone()
+        # The simulation reduces B1 over coils and multiplies the voxel signal
+        # with one coil sensitivity map at a time, both read a coil's voxels
+        self.B1 = B1.clone(memory_format=torch.contiguous_format)
+        self.coil_sens = coil_sens.clone(memory_format=torch.contiguous_format)
         self.fov = fov.clone()
         self.voxel_pos = voxel_pos.clone()
         self.avg_B1_trig = calc_avg_B1_trig(B1, PD)
@@ -106,21 +112,7 @@ class SimData:
         The returned :class:`SimData` is equivalent to :attr:`self` if the data
         already was on the GPU.
         """
-        return SimData(
-            self.PD.cuda(),
-            self.T1.cuda(),
-            self.T2.cuda(),
-            self.T2dash.cuda(),
-            self.D.cuda(),
-            self.B0.cuda(),
-            self.B1.cuda(),
-            self.coil_sens.cuda(),
-            self.fov.cuda(),
-            self.voxel_pos.cuda(),
-            self.nyquist.cuda(),
-            self.dephasing_func,
-            self.recover_func
-        )
+        return self._to("cuda")
 
     def cpu(self) -> SimData:
         """Move the simulation data to the CPU.
@@ -128,22 +120,80 @@ class SimData:
         The returned :class:`SimData` is equivalent to :attr:`self` if the data
         already was on the CPU.
         """
-        return SimData(
-            self.PD.cpu(),
-            self.T1.cpu(),
-            self.T2.cpu(),
-            self.T2dash.cpu(),
-            self.D.cpu(),
-            self.B0.cpu(),
-            self.B1.cpu(),
-            self.coil_sens.cpu(),
-            self.fov.cpu(),
-            self.voxel_pos.cpu(),
-            self.nyquist.cpu(),
-            self.dephasing_func,
-            self.recover_func
+        return self._to("cpu")
+
+    def _to(self, device: torch.device | str) -> SimData:
+        """Move all tensors to ``device`` with a single :func:`bulk_to`.
+
+        Tensors that already were on ``device`` are cloned, so the returned
+        instance never shares tensors with :attr:`self`.
+        """
+        tensors = [
+            self.PD,
+            self.T1,
+            self.T2,
+            self.T2dash,
+            self.D,
+            self.B0,
+            self.B1,
+            self.coil_sens,
+            self.fov,
+            self.voxel_pos,
+            self.avg_B1_trig,
+            self.nyquist,
+        ]
+        (PD, T1, T2, T2dash, D, B0, B1, coil_sens, fov, voxel_pos,
+         avg_B1_trig, nyquist) = [
+            moved.clone() if moved is tensor else moved
+            for moved, tensor in zip(bulk_to(tensors, device), tensors)
+        ]
+        return SimData._from_tensors(
+            PD, T1, T2, T2dash, D, B0, B1, coil_sens, fov, voxel_pos,
+            avg_B1_trig, nyquist, self.dephasing_func, self.recover_func
         )
 
+    @classmethod
+    def _from_tensors(
+        cls,
+        PD: torch.Tensor,
+        T1: torch.Tensor,
+        T2: torch.Tensor,
+        T2dash: torch.Tensor,
+        D: torch.Tensor,
+        B0: torch.Tensor,
+        B1: torch.Tensor,
+        coil_sens: torch.Tensor,
+        fov: torch.Tensor,
+        voxel_pos: torch.Tensor,
+        avg_B1_trig: torch.Tensor,
+        nyquist: torch.Tensor,
+        dephasing_func: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+        recover_func: Callable[[SimData], Any] | None = None,
+    ) -> SimData:
+        """Create a :class:`SimData` instance from already validated tensors.
+
+        In contrast to the constructor, ``avg_B1_trig`` is passed in instead
+        of being recomputed and tensors are neither clamped nor cloned. Used
+        to copy existing instances, e.g. when moving them to another device,
+        where the tensors are fresh copies of already clamped data.
+        """
+        data = cls.__new__(cls)
+        data.PD = PD
+        data.T1 = T1
+        data.T2 = T2
+        data.T2dash = T2dash
+        data.D = D
+        data.B0 = B0
+        data.B1 = B1
+        data.coil_sens = coil_sens
+        data.fov = fov
+        data.voxel_pos = voxel_pos
+        data.avg_B1_trig = avg_B1_trig
+        data.nyquist = nyquist
+        data.dephasing_func = dephasing_func
+        data.recover_func = recover_func
+        return data
+
     @property
     def device(self) -> torch.device:
         """The device (either CPU or a CUDA device) the data is stored on."""
@@ -158,7 +208,19 @@ class SimData:
             return self.recover_func(self)
 
 
-def calc_avg_B1_trig(B1: torch.Tensor, PD: torch.Tensor) -> torch.Tensor:
+@lru_cache(maxsize=None)
+def flip_angles(device: torch.device, dtype: torch.dtype) -> torch.Tensor:
+    """Return the 361 flip angles of the ``avg_B1_trig`` table, (0, 2pi).
+
+    Cached per device and dtype, the returned tensor must not be modified.
+    """
+    # Never cache an inference tensor, they can't be used with autograd
+    with torch.inference_mode(False):
+        return torch.linspace(0, 2*pi, 361, device=device, dtype=dtype)
+
+
+def calc_avg_B1_trig(B1: torch.Tensor, PD: torch.Tensor,
+                     block_size: int = 4096) -> torch.Tensor:
     """Return a (361, 3) tensor for B1 specific sin, cos and sin² values.
 
     This function calculates values for sin, cos and sin² for (0, 2pi) * B1 and
@@ -167,16 +229,31 @@ def calc_avg_B1_trig(B1: torch.Tensor, PD: torch.Tensor) -> torch.Tensor:
     to calcualte averaged rotations for the whole phantom. This is useful for
     the pre-pass, to get better magnetization estmates even if the pre-pass is
     not spatially resolved.
+
+    The phantom is processed in blocks of ``block_size`` voxels, which limits
+    the memory needed for intermediate values.
     """
     # With pTx, there are now potentially multiple B1 maps with phase.
     # NOTE: This is a (probably suboptimal) workaround
-    B1 = B1.sum(0).abs()
+    B1 = B1.sum(0).abs().type(torch.float32)
 
     B1 = B1.flatten()[:, None]  # voxels, 1
-    PD = (PD.flatten() / PD.sum())[:, None]  # voxels, 1
-    angle = torch.linspace(0, 2*pi, 361, device=PD.device)[None, :]  # 1, angle
-    return torch.stack([
-        (torch.sin(B1 * angle) * PD).sum(0),
-        (torch.cos(B1 * angle) * PD).sum(0),
-        (torch.sin(B1 * angle/2)**2 * PD).sum(0)
-    ], dim=1).type(torch.float32)
+    PD = (PD.flatten() / PD.sum()).type(torch.float32)  # voxels
+    angle = flip_angles(PD.device, PD.dtype)[None, :]  # 1, angle
+
+    # sin and cos are reduced directly, sin² follows from the average cos:
+    # sin²(x/2) = (1 - cos(x)) / 2 and PD is normalized, so avg(1) = 1.
+    # This evaluates two trigonometric functions per voxel and angle and
+    # needs no further elementwise products before the reductions.
+    # The voxels are processed in blocks to keep the (voxels, angle)
+    # intermediates small, so they stay in cache instead of allocating them
+    # for all voxels of large phantoms at once.
+    avg_sin = torch.zeros(361, device=PD.device)
+    avg_cos = torch.zeros(361, device=PD.device)
+    for start in range(0, PD.numel(), block_size):
+        block = slice(start, start + block_size)
+        phi = B1[block] * angle  # voxels, angle
+        avg_sin = avg_sin + PD[block] @ torch.sin(phi)
+        avg_cos = avg_cos + PD[block] @ torch.cos(phi)
+
+    return torch.stack([avg_sin, avg_cos, (1 - avg_cos) / 2], dim=1)
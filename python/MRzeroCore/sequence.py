@@ -1,9 +1,12 @@
 from __future__ import annotations
 import torch
+import numpy as np
 from enum import Enum
 from typing import Iterable
+import weakref
 import matplotlib.pyplot as plt
 from .pulseq.pulseq_loader import intermediate, PulseqFile, Adc, Spoiler
+from .util import bulk_to
 
 
 class PulseUsage(Enum):
@@ -72,21 +75,19 @@ class Pulse:
 
     def cpu(self) -> Pulse:
         """Move this pulse to the CPU and return it."""
-        return Pulse(
-            self.usage,
-            torch.as_tensor(self.angle, dtype=torch.float).cpu(),
-            torch.as_tensor(self.phase, dtype=torch.float).cpu(),
-            self.selective
-        )
+        return self._to("cpu")
 
     def cuda(self, device: int = None) -> Pulse:
         """Move this pulse to the specified CUDA device and return it."""
-        return Pulse(
-            self.usage,
-            torch.as_tensor(self.angle, dtype=torch.float).cuda(device),
-            torch.as_tensor(self.phase, dtype=torch.float).cuda(device),
-            self.selective
-        )
+        return self._to("cuda" if device is None else device)
+
+    def _to(self, device: torch.device | str | int) -> Pulse:
+        """Move angle and phase to ``device`` with a single :func:`bulk_to`."""
+        angle, phase = bulk_to([
+            torch.as_tensor(self.angle, dtype=torch.float),
+            torch.as_tensor(self.phase, dtype=torch.float),
+        ], device)
+        return Pulse(self.usage, angle, phase, self.selective)
 
     @property
     def device(self) -> torch.device:
@@ -146,26 +147,21 @@ class Repetition:
         self.pulse = pulse
         self.event_count = event_time.numel()
 
-        if event_time.shape != torch.Size([self.event_count]):
-            raise ValueError(
-                f"Wrong event_time shape {tuple(event_time.shape)}, "
-                f"expected {(self.event_count, )}"
-            )
-        if gradm.shape != torch.Size([self.event_count, 3]):
-            raise ValueError(
-                f"Wrong gradm shape {tuple(gradm.shape)}, "
-                f"expected {(self.event_count, 3)}"
-            )
-        if adc_phase.shape != torch.Size([self.event_count]):
-            raise ValueError(
-                f"Wrong adc_phase shape {tuple(adc_phase.shape)}, "
-                f"expected {(self.event_count, )}"
-            )
-        if adc_usage.shape != torch.Size([self.event_count]):
-            raise ValueError(
-                f"Wrong adc_usage shape {tuple(adc_usage.shape)}, "
-                f"expected {(self.event_count, )}"
-            )
+        # Compare all shapes at once, only look for the culprit on failure
+        shapes = (
+            event_time.shape, gradm.shape, adc_phase.shape, adc_usage.shape
+        )
+        expected = (
+            (self.event_count, ), (self.event_count, 3),
+            (self.event_count, ), (self.event_count, )
+        )
+        if shapes != expected:
+            names = ("event_time", "gradm", "adc_phase", "adc_usage")
+            for name, shape, exp in zip(names, shapes, expected):
+                if shape != exp:
+                    raise ValueError(
+                        f"Wrong {name} shape {tuple(shape)}, expected {exp}"
+                    )
 
         self.event_time = event_time
         self.gradm = gradm
@@ -174,22 +170,34 @@ class Repetition:
 
     def cuda(self, device: int = None) -> Repetition:
         """Move this repetition to the specified CUDA device and return it."""
-        return Repetition(
-            self.pulse.cuda(device),
-            self.event_time.cuda(device),
-            self.gradm.cuda(device),
-            self.adc_phase.cuda(device),
-            self.adc_usage.cuda(device)
+        return self._with_tensors(
+            bulk_to(self._tensors(), "cuda" if device is None else device)
         )
 
     def cpu(self) -> Repetition:
         """Move this repetition to the CPU and return it."""
+        return self._with_tensors(bulk_to(self._tensors(), "cpu"))
+
+    def _tensors(self) -> list[torch.Tensor]:
+        """Return all tensors of this repetition, including the pulse."""
+        return [
+            torch.as_tensor(self.pulse.angle, dtype=torch.float),
+            torch.as_tensor(self.pulse.phase, dtype=torch.float),
+            self.event_time,
+            self.gradm,
+            self.adc_phase,
+            self.adc_usage,
+        ]
+
+    def _with_tensors(self, tensors: list[torch.Tensor]) -> Repetition:
+        """Create a copy of self using tensors ordered like :meth:`_tensors`."""
+        angle, phase, event_time, gradm, adc_phase, adc_usage = tensors
         return Repetition(
-            self.pulse.cpu(),
-            self.event_time.cpu(),
-            self.gradm.cpu(),
-            self.adc_phase.cpu(),
-            self.adc_usage.cpu()
+            Pulse(self.pulse.usage, angle, phase, self.pulse.selective),
+            event_time,
+            gradm,
+            adc_phase,
+            adc_usage
         )
 
     @property
@@ -231,7 +239,7 @@ class Repetition:
 
     def get_contrasts(self) -> list[int]:
         """Return a sorted list of contrasts used by this ``Repetition``."""
-        return sorted(self.adc_usage[self.adc_usage > 0].unique().tolist())
+        return used_contrasts(self.adc_usage)
 
     def shift_contrasts(self, offset: int):
         """Increment all contrasts used by this repetition by ``offset``.
@@ -255,11 +263,23 @@ class Sequence(list):
 
     def cuda(self) -> Sequence:
         """Move this sequence to the specified CUDA device and return it."""
-        return Sequence([rep.cuda() for rep in self])
+        return self._to("cuda")
 
     def cpu(self) -> Sequence:
         """Move this sequence to the CPU and return it."""
-        return Sequence([rep.cpu() for rep in self])
+        return self._to("cpu")
+
+    def _to(self, device: torch.device | str) -> Sequence:
+        """Move the tensors of all repetitions with a single :func:`bulk_to`."""
+        rep_tensors = [rep._tensors() for rep in self]
+        moved = bulk_to([t for tensors in rep_tensors for t in tensors], device)
+
+        seq = Sequence()
+        start = 0
+        for rep, tensors in zip(self, rep_tensors):
+            seq.append(rep._with_tensors(moved[start:start + len(tensors)]))
+            start += len(tensors)
+        return seq
 
     @property
     def device(self) -> torch.device:
@@ -289,28 +309,108 @@ class Sequence(list):
         list[torch.Tensor]
             A tensor of shape (``event_count``, 4) for every repetition.
         """
-        k_pos = torch.zeros(4, device=self.device)
-        trajectory = []
-        # Pulses with usage STORE store magnetisation and update this variable,
-        # following excitation pulses will reset to stored instead of origin
-        stored = torch.zeros(4, device=self.device)
+        # Clone so that the returned tensors don't alias the cached trajectory
+        # or the results of other calls
+        return [t.clone() for t in torch.split(
+            self._trajectory(), [rep.event_count for rep in self]
+        )]
+
+    def _trajectory(self) -> torch.Tensor:
+        """Return the trajectory of all events as one (events, 4) tensor.
+
+        See :meth:`get_full_kspace`, which splits it into repetitions. The
+        result is cached until the repetitions, their pulse usages or the
+        gradm / event_time tensors change. In-place modifications are detected
+        by the version counters of the tensors. Sequences with tensors that
+        require grad are never cached, independent of grad mode, so every call
+        builds a fresh autograd graph and no detached result is reused. The
+        cache only holds weak references to the gradm / event_time tensors,
+        so replaced tensors are not kept alive. The returned tensor is shared
+        between calls and must not be handed out without copying it.
+        """
+        tensors = [t for rep in self for t in (rep.gradm, rep.event_time)]
+        if any(t.requires_grad or t.is_inference() for t in tensors):
+            # Inference tensors have no version counter
+            self._trajectory_cache = None
+            return self._calc_trajectory()
+        versions = [
+            (rep.pulse.usage, rep.gradm._version, rep.event_time._version)
+            for rep in self
+        ]
+
+        cache = getattr(self, "_trajectory_cache", None)
+        if cache is not None:
+            cached_refs, cached_versions, trajectory, version = cache
+            if (
+                version == trajectory._version
+                and cached_versions == versions
+                and len(cached_refs) == len(tensors)
+                and all(ref() is t for ref, t in zip(cached_refs, tensors))
+            ):
+                return trajectory
+
+        trajectory = self._calc_trajectory()
+        self._trajectory_cache = (
+            [weakref.ref(t) for t in tensors], versions,
+            trajectory, trajectory._version
+        )
+        return trajectory
 
-        for rep in self:
-            if rep.pulse.usage == PulseUsage.EXCIT:
-                k_pos = stored
-            elif rep.pulse.usage == PulseUsage.REFOC:
-                k_pos = -k_pos
-            elif rep.pulse.usage == PulseUsage.STORE:
-                stored = k_pos
-
-            rep_traj = k_pos + torch.cumsum(
-                torch.cat([rep.gradm, rep.event_time[:, None]], 1),
-                dim=0
+    def _calc_trajectory(self) -> torch.Tensor:
+        """Compute the trajectory returned by :meth:`_trajectory`.
+
+        Refocussing pulses mirror the trajectory, which is handled by
+        multiplying all events with the sign of their repetition: a single
+        cumsum then describes the whole sequence. Excitation pulses reset
+        the position, which adds a constant offset to all following events.
+        Signs and offsets are derived from the pulse usages in a scan over
+        python values (see :func:`scan_pulse_usages`), so that the device
+        only sees a few operations on the whole sequence.
+        """
+        event_count = [rep.event_count for rep in self]
+        signs, anchors, levels = scan_pulse_usages(
+            [rep.pulse.usage for rep in self]
+        )
+        device = self.device
+        rep_id = torch.repeat_interleave(
+            torch.tensor(event_count, device=device),
+            output_size=sum(event_count)
+        )
+        sign = torch.tensor(signs, dtype=torch.double, device=device)
+        anchor = torch.tensor(anchors, device=device)
+
+        events = torch.cat([
+            self._flat("gradm"), self._flat("event_time")[:, None]
+        ], 1)
+        # A single cumsum over all events of the sequence. It is done in double
+        # precision because it accumulates over the whole sequence, trajectory
+        # positions are then recovered as differences of large values.
+        cumsum = torch.cumsum(events.double() * sign[rep_id, None], dim=0)
+        cumsum = torch.cat([torch.zeros_like(cumsum[:1]), cumsum])
+        rep_begin = cumsum[np.cumsum([0] + event_count[:-1])]
+
+        # Offset of every excitation, which starts at the origin...
+        offset = -rep_begin
+        # ... or at the position stored by a previous STORE pulse
+        for level in levels:
+            excit, store = (torch.tensor(x, device=device) for x in zip(*level))
+            stored = sign[store, None] * (
+                rep_begin[store] + offset[anchor[store]]
             )
-            k_pos = rep_traj[-1, :]
-            trajectory.append(rep_traj)
+            offset = offset.index_add(0, excit, sign[excit, None] * stored)
 
-        return trajectory
+        trajectory = sign[rep_id, None] * (
+            cumsum[1:] + offset[anchor][rep_id]
+        )
+        return trajectory.type(events.dtype)
+
+    def _flat(self, attr: str) -> torch.Tensor:
+        """Concatenate the ``attr`` tensors of all repetitions into one.
+
+        Operating on these concatenated tensors replaces per-repetition loops
+        of small tensor operations by single operations on the whole sequence.
+        """
+        return torch.cat([getattr(rep, attr) for rep in self])
 
     def get_kspace(self) -> torch.Tensor:
         """Calculate the trajectory described by the signal of this sequence.
@@ -324,13 +424,9 @@ class Sequence(list):
         torch.Tensor
             Float tensor of shape (sample_count, 4)
         """
-        # - Iterate over the full kspace and the sequence repetitions
-        # - Mask the kspace to only retain samples that were measured
-        # - Concatenate all repetitions and return the result
-        return torch.cat([
-            shot[rep.adc_usage > 0]
-            for shot, rep in zip(self.get_full_kspace(), self)
-        ])
+        # Mask the trajectory of the whole sequence to only retain samples
+        # that were measured
+        return self._trajectory()[self._flat("adc_usage") > 0]
 
     def get_contrast_mask(self, contrast: int) -> torch.Tensor:
         """Return a mask for a specific contrast as bool tensor.
@@ -355,16 +451,14 @@ class Sequence(list):
         >>> mask = seq.get_contrast_mask(7)
         >>> contrast_reco = reco(signal[mask], kspace[mask])
         """
-        return torch.cat(
-            [rep.adc_usage[rep.adc_usage != 0] == contrast for rep in self]
-        )
+        adc_usage = self._flat("adc_usage")
+        return adc_usage[adc_usage != 0] == contrast
 
     def get_contrasts(self) -> list[int]:
         """Return a sorted list of all contrasts used by this ``Sequence``."""
-        # flat list of all contrasts of all sequences
-        tmp = [c for rep in self for c in rep.get_contrasts()]
-        # Use a set to remove duplicates
-        return sorted(list(set(tmp)))
+        if len(self) == 0:
+            return []
+        return used_contrasts(self._flat("adc_usage"))
 
     def shift_contrasts(self, offset: int):
         """Increment all offsets used by this sequence by ``offset``.
@@ -379,7 +473,31 @@ class Sequence(list):
 
     def get_duration(self) -> float:
         """Calculate the total duration of self in seconds."""
-        return sum(rep.event_time.sum().item() for rep in self)
+        if len(self) == 0:
+            return 0.0
+        return self._flat("event_time").double().sum().item()
+
+    def save(self, file_name: str):
+        """Save this sequence to a file, can be loaded with :meth:`load`.
+
+        Uses :func:`torch.save`, which serializes the tensor storages directly
+        instead of pickling them.
+        """
+        torch.save(self, file_name)
+
+    @classmethod
+    def load(cls, file_name: str) -> Sequence:
+        """Load a sequence that was saved with :meth:`save` to the CPU.
+
+        Like any pickle based format, only load files from trusted sources.
+        """
+        return torch.load(file_name, map_location="cpu", weights_only=False)
+
+    def __getstate__(self) -> dict:
+        # Don't serialize the cached trajectory, it is cheap to recompute
+        state = self.__dict__.copy()
+        state.pop("_trajectory_cache", None)
+        return state
 
     @classmethod
     def from_seq_file(cls, file_name: str) -> Sequence:
@@ -460,8 +578,13 @@ class Sequence(list):
         # TODO: We could (optionally) plot which contrast a sample belongs to,
         # currently we only plot if it is measured or not
 
-        kspace = self.get_full_kspace()
-        adc_mask = [rep.adc_usage > 0 for rep in self]
+        # Copy the trajectory and adc mask of the whole sequence to the host
+        # at once and only split the numpy arrays into repetitions
+        split = np.cumsum([rep.event_count for rep in self])[:-1]
+        kspace = np.split(self._trajectory().detach().cpu().numpy(), split)
+        adc_mask = np.split(
+            (self._flat("adc_usage") > 0).cpu().numpy(), split
+        )
 
         cmap = plt.get_cmap('rainbow')
         plt.figure(figsize=figsize)
@@ -482,7 +605,7 @@ class Sequence(list):
             plt.subplot(212)
             event = 0
             for i, rep_traj in enumerate(kspace):
-                x = torch.arange(event, event + rep_traj.shape[0], 1)
+                x = np.arange(event, event + rep_traj.shape[0], 1)
                 event += rep_traj.shape[0]
 
                 if i == 0:
@@ -501,6 +624,68 @@ class Sequence(list):
         plt.show()
 
 
+def scan_pulse_usages(
+    usages: list[PulseUsage],
+) -> tuple[list[float], list[int], list[list[tuple[int, int]]]]:
+    """Extract how pulses change the kspace position of a sequence.
+
+    Parameters
+    ----------
+    usages : list[PulseUsage]
+        The pulse usage of every repetition
+
+    Returns
+    -------
+    signs : list[float]
+        Per repetition, -1 or 1 as flipped by every refocussing pulse
+    anchors : list[int]
+        Per repetition, the index of the last excitation (or 0)
+    levels : list[list[(int, int)]]
+        Pairs of (excitation, store) indices for excitations that start at the
+        position stored by a STORE pulse. Grouped in levels, where a level
+        only depends on the positions resolved by the previous ones.
+    """
+    sign = 1.0
+    anchor = 0
+    store = None
+    signs = []
+    anchors = []
+    levels = []
+    # Number of stored positions an excitation depends on
+    depth = {0: 0}
+
+    for rep, usage in enumerate(usages):
+        if usage == PulseUsage.EXCIT:
+            anchor = rep
+            if store is None:
+                depth[rep] = 0
+            else:
+                depth[rep] = depth[anchors[store]] + 1
+                if len(levels) < depth[rep]:
+                    levels.append([])
+                levels[depth[rep] - 1].append((rep, store))
+        elif usage == PulseUsage.REFOC:
+            sign = -sign
+        elif usage == PulseUsage.STORE:
+            store = rep
+
+        signs.append(sign)
+        anchors.append(anchor)
+
+    return signs, anchors, levels
+
+
+def used_contrasts(adc_usage: torch.Tensor) -> list[int]:
+    """Return a sorted list of all positive values in ``adc_usage``.
+
+    Uses a histogram of the contrasts, which is cheaper than ``unique`` for
+    the small contrast indices used in practice and needs a single sync.
+    ``adc_usage`` is cast to integers, as user code might assign floats.
+    """
+    present = torch.bincount(adc_usage.long().clamp(min=0))[1:] > 0
+    return (present.nonzero().flatten() + 1).tolist()
+
+
 def chain(*sequences: Sequence, oneshot: bool = False) -> Sequence:
     """Chain multiple sequences into one.
 
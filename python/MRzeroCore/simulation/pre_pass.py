@@ -75,7 +75,9 @@ def compute_graph_ext(
             torch.sin(angle),
             torch.cos(angle),
             torch.sin(angle/2)**2
-        ], dim=1).type(torch.float32)
+        ], dim=1)
+    # The pre-pass reads the raw data of this table as (361, 3) float32 values
+    avg_b1_trig = avg_b1_trig.type(torch.float32).contiguous()
 
     return Graph(_prepass.compute_graph(
         seq,
@@ -0,0 +1,65 @@
+from __future__ import annotations
+import torch
+
+
+def bulk_to(tensors: list[torch.Tensor], device: torch.device | str | int
+            ) -> list[torch.Tensor]:
+    """Move a list of tensors to ``device`` with as few copies as possible.
+
+    Tensors are grouped by dtype and source device. Every group is flattened
+    into a single buffer, transferred with one copy and split again on the
+    target device, where every output gets its own storage. For host to GPU copies, the buffer is allocated in pinned
+    memory so the transfer can run asynchronously. Tensors that require grad
+    are moved individually with :meth:`torch.Tensor.to`, so they don't
+    attach the other tensors to their autograd graph. Like
+    :meth:`torch.Tensor.to`, tensors already stored on ``device`` are
+    returned as they are.
+
+    Parameters
+    ----------
+    tensors : list[torch.Tensor]
+        The tensors that should be moved
+    device : torch.device | str | int
+        The target device, integers refer to CUDA devices
+
+    Returns
+    -------
+    list[torch.Tensor]
+        The moved tensors, in the same order and with the same shapes
+    """
+    device = torch.device(device)
+    if device.type == "cuda" and device.index is None:
+        device = torch.device("cuda", torch.cuda.current_device())
+
+    result = list(tensors)
+    groups: dict[tuple[torch.dtype, torch.device], list[int]] = {}
+    for i, tensor in enumerate(tensors):
+        if tensor.device == device:
+            continue
+        if tensor.requires_grad:
+            result[i] = tensor.to(device)
+        else:
+            groups.setdefault((tensor.dtype, tensor.device), []).append(i)
+
+    for (dtype, source), indices in groups.items():
+        parts = [tensors[i].reshape(-1) for i in indices]
+        pin = device.type == "cuda" and source.type == "cpu"
+        if pin:
+            buffer = torch.empty(
+                sum(part.numel() for part in parts),
+                dtype=dtype, pin_memory=True
+            )
+            torch.cat(parts, out=buffer)
+        else:
+            buffer = torch.cat(parts)
+
+        buffer = buffer.to(device, non_blocking=pin)
+        # Clone every slice so the outputs don't share storage and version
+        # counter with the buffer and each other
+        start = 0
+        for i, part in zip(indices, parts):
+            end = start + part.numel()
+            result[i] = buffer[start:end].view(tensors[i].shape).clone()
+            start = end
+
+    return result